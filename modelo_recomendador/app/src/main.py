@@ -1,22 +1,42 @@
-from fastapi import FastAPI
-import pickle
+from functools import lru_cache
+from typing import Tuple
+from fastapi import FastAPI, HTTPException, Query
 import numpy as np
 
 app = FastAPI()
 
-# Cargar la matriz de co-ocurrencia desde el archivo .pkl
-with open('../models/co_ocurrence_matrix.pkl', 'rb') as f:
-    co_ocurrence_matrix = pickle.load(f)
+top_similar_products = None
+_cols = None
+_sc2idx = {}
 
-# Cargar la matriz de similitudes desde el archivo .pkl
-with open('../models/product_similarities.pkl', 'rb') as f:
-    product_similarities = pickle.load(f)
+@app.on_event("startup")
+def load_models():
+    global top_similar_products, _cols, _sc2idx
+
+    # Cargar los stockcodes y precalcular el mapeo stockcode <-> índice
+    _cols = np.load('../models/stockcodes.npy')
+    _sc2idx = {s: i for i, s in enumerate(_cols)}
+
+    # Mapear la tabla precalculada de productos similares (compartida entre workers)
+    top_similar_products = np.load('../models/top_similar_products.npy', mmap_mode='r')
+
+    # Invalidar las respuestas cacheadas del modelo anterior
+    _top.cache_clear()
+
+@lru_cache(maxsize=16384)
+def _top(stockcode: str, n: int) -> Tuple[str, ...]:
+    product_idx = _sc2idx[stockcode]
+    # La tabla no incluye al propio producto
+    idx = top_similar_products[product_idx, :n]
+    return tuple(_cols[idx].tolist())
 
 @app.get("/recommend/{stockcode}")
-def recommend(stockcode: str, n: int = 10):
-    product_idx = co_ocurrence_matrix.columns.get_loc(stockcode)
-    sim_scores = list(enumerate(product_similarities[product_idx]))
-    sim_scores = sorted(sim_scores, key=lambda x: x[1], reverse=True)
-    sim_scores = sim_scores[1:n+1]
-    similar_products = [co_ocurrence_matrix.columns[i[0]] for i in sim_scores]
-    return {"stockcode": stockcode, "recommendations": similar_products}
+async def recommend(stockcode: str, n: int = Query(10, ge=0)):
+    # La tabla precalculada guarda N_MAX vecinos por producto
+    max_n = top_similar_products.shape[1]
+    if n > max_n:
+        raise HTTPException(
+            status_code=422,
+            detail=f"n debe ser menor o igual a {max_n}"
+        )
+    return {"stockcode": stockcode, "recommendations": list(_top(stockcode, n))}
@@ -1,18 +1,51 @@
-from typing import Dict, List
+from typing import Dict, List, Tuple
 from fastapi import Body, FastAPI, HTTPException
-import pickle
+import numpy as np
 import pandas as pd
 from pydantic import BaseModel, ConfigDict, Field
 
 app = FastAPI()
 
-# Cargar las reglas de asociación desde el archivo .pkl
-with open('../../models/association_rules.pkl', 'rb') as f:
-    rules = pickle.load(f)
+EMPTY = np.empty(0, dtype=np.int32)
+
+rules_index: Dict[str, np.ndarray] = {}
+consequents_arr = np.empty(0, dtype=object)
+
+def build_rules_index(rules: pd.DataFrame) -> Tuple[Dict[str, np.ndarray], np.ndarray]:
+    """
+    Construye un índice de antecedente a reglas, ordenadas por lift descendente.
+
+    Args:
+        rules (pd.DataFrame): DataFrame con las reglas de asociación.
+
+    Returns:
+        Tuple[Dict[str, np.ndarray], np.ndarray]: El índice stockcode -> posiciones de
+        las reglas y el arreglo de consecuentes alineado con esas posiciones.
+    """
+    rules_sorted = rules.sort_values('lift', ascending=False).reset_index(drop=True)
+    index: Dict[str, List[int]] = {}
+    for i, antecedents in enumerate(rules_sorted['antecedents'].values):
+        for s in antecedents:
+            index.setdefault(s, []).append(i)
+    index_arr = {s: np.asarray(ids, dtype=np.int32) for s, ids in index.items()}
+    return index_arr, rules_sorted['consequents'].to_numpy()
+
+@app.on_event("startup")
+def load_rules():
+    """
+    Carga las reglas de asociación y construye su índice al iniciar la aplicación.
+    """
+    global rules_index, consequents_arr
+
+    # Cargar las reglas de asociación desde el archivo .parquet
+    rules = pd.read_parquet('../../models/association_rules.parquet', engine='pyarrow', dtype_backend='pyarrow')
+
+    rules_index, consequents_arr = build_rules_index(rules)
 
 def recommend_association_rules(
     stockcode: str,
-    rules: pd.DataFrame,
+    index: Dict[str, np.ndarray],
+    consequents: np.ndarray,
     n: int = 10
 ) -> Dict[str, List[str]]:
     """
@@ -20,21 +53,18 @@ def recommend_association_rules(
 
     Args:
         stockcode (str): El código del producto para el cual se desean recomendaciones.
-        rules (pd.DataFrame): DataFrame con las reglas de asociación.
+        index (Dict[str, np.ndarray]): Índice de antecedente a posiciones de reglas.
+        consequents (np.ndarray): Consecuentes de las reglas, ordenados por lift.
         n (int, opcional): Número de recomendaciones a devolver. Por defecto es 10.
 
     Returns:
         Dict[str, List[str]]: Un diccionario con el stockcode y una lista de recomendaciones únicas.
     """
-    product_rules = rules[rules['antecedents'].apply(lambda x: stockcode in x)]
-    product_rules = product_rules.sort_values(by='lift', ascending=False).head(n)
-    recommended_products = []
-    
-    for rule in product_rules['consequents']:
-        recommended_products.extend(list(rule))
-    
-    # Eliminar productos duplicados
-    unique_recommendations = list(set(recommended_products))
+    idx = index.get(stockcode, EMPTY)[:n]
+    recommended_products = [c for row in consequents[idx] for c in row]
+
+    # Eliminar productos duplicados conservando el orden por lift
+    unique_recommendations = list(dict.fromkeys(recommended_products))
     
     return {"stockcode": stockcode, "recommendations": unique_recommendations}
 
@@ -59,7 +89,7 @@ class StockcodesModel(BaseModel):
     )
 
 @app.post("/recommend/")
-def recommend(stockcodes: List[StockcodesModel]):
+async def recommend(stockcodes: List[StockcodesModel]):
     """
     Endpoint para obtener recomendaciones para múltiples stockcodes.
 
@@ -70,13 +100,17 @@ def recommend(stockcodes: List[StockcodesModel]):
         List[Dict[str, List[str]]]: Lista de diccionarios con el stockcode y las recomendaciones únicas.
     """
     recommendations_list = []
-    
+
     for item in stockcodes:
-        stockcode = item.stockcode
-        n = item.recommendations
-        recommendations = recommend_association_rules(stockcode, rules, n)
-        
+        # Los stockcodes sin reglas se descartan con una sola consulta al índice
+        if item.stockcode not in rules_index:
+            continue
+
+        recommendations = recommend_association_rules(
+            item.stockcode, rules_index, consequents_arr, item.recommendations
+        )
+
         if recommendations["recommendations"]:
             recommendations_list.append(recommendations)
-    
+
     return recommendations_list
@@ -1,4 +1,5 @@
 import pandas as pd
+import pyarrow.parquet as pq
 from evidently.metric_preset import DataDriftPreset
 from evidently.report import Report
 from dotenv import load_dotenv
@@ -53,14 +54,14 @@ def connect_to_snowflake():
 
 def fetch_data_from_snowflake(conn, query=""):
     """
-    Ejecuta una consulta en Snowflake y devuelve los datos como un DataFrame.
+    Ejecuta una consulta en Snowflake y devuelve los datos como una tabla de Arrow.
 
     Parámetros:
     - conn: Conexión a Snowflake.
     - query: Consulta SQL a ejecutar.
 
     Retorna:
-    - Un DataFrame con los datos obtenidos de Snowflake.
+    - Una pyarrow.Table con los datos obtenidos de Snowflake (vacía si la consulta no devuelve filas).
     """
 
     if query is None:
@@ -70,9 +71,10 @@ def fetch_data_from_snowflake(conn, query=""):
     try:
         cursor = conn.cursor()
         cursor.execute(query)
-        dataframe = cursor.fetch_pandas_all()
+        # Leer los resultados directamente en formato Arrow (tabla vacía si no hay filas)
+        table = cursor.fetch_arrow_all(force_return_table=True)
         cursor.close()
-        return dataframe
+        return table
     except snowflake.connector.errors.ProgrammingError as e:
         print(f"Error de SQL en Snowflake: {e}")
         raise
@@ -114,7 +116,7 @@ def detectar_drift():
         
          # Conectar a la base de datos de Snowflake
         snowflake_conn = connect_to_snowflake()
-        dataframe_retail_data = fetch_data_from_snowflake(snowflake_conn)
+        table_retail_data = fetch_data_from_snowflake(snowflake_conn)
         snowflake_conn.close()
 
         # Verificar si el archivo old_invoice_data.parquet ya existe
@@ -123,13 +125,13 @@ def detectar_drift():
         new_file_path = os.path.join(data_folder, 'new_invoice_data.parquet')
 
         if check_file_exists(old_file_path):
-            dataframe_retail_data.to_parquet(path=new_file_path, engine='pyarrow', index=False)
+            pq.write_table(table_retail_data, new_file_path, compression='snappy')
         else:
-            dataframe_retail_data.to_parquet(path=old_file_path, engine='pyarrow', index=False)
+            pq.write_table(table_retail_data, old_file_path, compression='snappy')
 
         # Cargar los datos de referencia y los nuevos datos desde archivos Parquet
-        reference_data = pd.read_parquet("../data/old_invoice_data.parquet")
-        new_data = pd.read_parquet("../data/new_invoice_data.parquet")
+        reference_data = pd.read_parquet("../data/old_invoice_data.parquet", engine='pyarrow', use_threads=True)
+        new_data = pd.read_parquet("../data/new_invoice_data.parquet", engine='pyarrow', use_threads=True)
     except FileNotFoundError as e:
         print(f"Error: No se encontró el archivo: {e.filename}")
         with open("drift_detected.txt", "w") as f:
@@ -0,0 +1,103 @@
+import os
+import pickle
+
+import numba
+import numpy as np
+import scipy.sparse as sp
+
+# Número de vecinos guardados por producto (sin incluir al propio producto)
+N_MAX = 100
+
+@numba.njit(fastmath=True, cache=True)
+def topn_cosine(q_idx, q_val, indptr, indices, data, n_products, n, exclude=-1):
+    """
+    Calcula los n productos más similares a un producto de consulta.
+
+    Args:
+        q_idx (numpy.ndarray): Facturas en las que aparece el producto de consulta.
+        q_val (numpy.ndarray): Valores normalizados del producto en esas facturas.
+        indptr (numpy.ndarray): Punteros CSR de la matriz normalizada (facturas x productos).
+        indices (numpy.ndarray): Índices de producto de la matriz CSR.
+        data (numpy.ndarray): Valores de la matriz CSR.
+        n_products (int): Número total de productos.
+        n (int): Número de productos a devolver.
+        exclude (int): Índice de producto a excluir del resultado (el propio producto
+            de consulta). -1 para no excluir ninguno.
+
+    Returns:
+        tuple: Índices (int32) y similitudes de los n productos más similares, en orden descendente.
+    """
+    scores = np.zeros(n_products, dtype=np.float32)
+    for k in range(q_idx.size):
+        v = q_idx[k]
+        w = q_val[k]
+        for p in range(indptr[v], indptr[v + 1]):
+            scores[indices[p]] += w * data[p]
+    if exclude >= 0:
+        scores[exclude] = -np.inf
+    # Orden estable: en caso de empate gana el índice de producto menor
+    order = np.argsort(-scores, kind='mergesort')[:n]
+    return order.astype(np.int32), scores[order]
+
+@numba.njit(parallel=True, fastmath=True, cache=True)
+def topn_table(p_indptr, p_indices, p_data, indptr, indices, data, n):
+    """
+    Calcula la tabla de los n productos más similares para todos los productos.
+
+    Args:
+        p_indptr (numpy.ndarray): Punteros CSR de la matriz normalizada (productos x facturas).
+        p_indices (numpy.ndarray): Índices de factura de la matriz por productos.
+        p_data (numpy.ndarray): Valores de la matriz por productos.
+        indptr (numpy.ndarray): Punteros CSR de la matriz normalizada (facturas x productos).
+        indices (numpy.ndarray): Índices de producto de la matriz por facturas.
+        data (numpy.ndarray): Valores de la matriz por facturas.
+        n (int): Número de productos similares por fila.
+
+    Returns:
+        numpy.ndarray: Matriz int32 de forma (productos, n) con los índices de los más similares,
+        sin incluir al propio producto.
+    """
+    n_products = p_indptr.size - 1
+    out = np.empty((n_products, n), dtype=np.int32)
+    for i in numba.prange(n_products):
+        start, end = p_indptr[i], p_indptr[i + 1]
+        idx, _ = topn_cosine(
+            p_indices[start:end], p_data[start:end], indptr, indices, data, n_products, n, i
+        )
+        out[i, :] = idx
+    return out
+
+def precompute_topn(basket, n=N_MAX):
+    """
+    Precalcula los productos más similares por similitud de coseno sin materializar
+    la matriz completa de similitudes (productos x productos).
+
+    Args:
+        basket (scipy.sparse.spmatrix): Matriz de co-ocurrencia (facturas x productos).
+        n (int): Número de productos similares por fila. Por defecto es N_MAX.
+
+    Returns:
+        numpy.ndarray: Matriz int32 de forma (productos, n) con los índices de los más similares,
+        sin incluir al propio producto.
+    """
+    X = sp.csr_matrix(basket, dtype=np.float32)
+    norms = np.sqrt(np.asarray(X.multiply(X).sum(axis=0)).ravel())
+    X = (X @ sp.diags(1 / np.maximum(norms, 1e-12))).astype(np.float32).tocsr()
+    Xp = X.T.tocsr()
+    n = min(n, X.shape[1] - 1)
+    return topn_table(Xp.indptr, Xp.indices, Xp.data, X.indptr, X.indices, X.data, n)
+
+def main():
+    """
+    Carga la matriz de co-ocurrencia y guarda la tabla de productos más similares.
+    """
+    with open('models/co_ocurrence_matrix.pkl', 'rb') as f:
+        co_ocurrence_matrix = pickle.load(f)
+
+    top_similar_products = precompute_topn(co_ocurrence_matrix.sparse.to_coo())
+
+    os.makedirs('models', exist_ok=True)
+    np.save('models/top_similar_products.npy', top_similar_products)
+
+if __name__ == "__main__":
+    main()
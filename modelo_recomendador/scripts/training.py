@@ -1,6 +1,6 @@
 import numpy as np
 import pandas as pd
-from sklearn.metrics.pairwise import cosine_similarity
+import scipy.sparse as sp
 import snowflake.connector
 import os
 from dotenv import load_dotenv
@@ -9,6 +9,7 @@ import mlflow
 import mlflow.sklearn
 import sqlite3
 import pickle
+from precompute_topn import N_MAX
 
 # Cargar variables de entorno
 load_dotenv()
@@ -22,6 +23,9 @@ mlflow.start_run()
 try:
     # Conectar a la base de datos SQLite
     conn = sqlite3.connect('recommendations.db')
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('PRAGMA synchronous=NORMAL')
+    conn.execute('PRAGMA temp_store=MEMORY')
     cursor = conn.cursor()
 
     # Crear tabla si no existe
@@ -35,8 +39,15 @@ try:
     # Leer el archivo parquet
     dataframe_retail_data = pd.read_parquet('data/output_file.parquet', engine='pyarrow')
 
-    # Crear una tabla de co-ocurrencia
-    co_ocurrence_matrix = dataframe_retail_data.pivot_table(index="INVOICENO", columns="STOCKCODE", aggfunc="size", fill_value=0)
+    # Crear una tabla de co-ocurrencia dispersa (facturas x productos)
+    inv_codes, inv_u = pd.factorize(dataframe_retail_data["INVOICENO"], sort=True)
+    sc_codes, sc_u = pd.factorize(dataframe_retail_data["STOCKCODE"], sort=True)
+    # Descartar filas con factura o producto nulo (código -1), igual que pivot_table
+    keep = (inv_codes >= 0) & (sc_codes >= 0)
+    inv_codes, sc_codes = inv_codes[keep], sc_codes[keep]
+    data = np.ones(len(inv_codes), dtype=np.int32)
+    basket = sp.csr_matrix((data, (inv_codes, sc_codes)), shape=(len(inv_u), len(sc_u)))
+    co_ocurrence_matrix = pd.DataFrame.sparse.from_spmatrix(basket, index=inv_u, columns=sc_u)
 
     # Guardar la matriz de co-ocurrencia en un archivo .pkl
     os.makedirs('models', exist_ok=True)
@@ -47,29 +58,50 @@ try:
     # Registrar el archivo de la matriz en MLflow
     mlflow.log_artifact(co_ocurrence_matrix_path)
 
-    # Calcular similitudes entre productos
-    product_similarities = cosine_similarity(co_ocurrence_matrix.T)
-
-    # Guardar la matriz de similitudes en un archivo .pkl
-    product_similarities_path = 'models/product_similarities.pkl'
-    with open(product_similarities_path, 'wb') as f:
-        pickle.dump(product_similarities, f)
+    # Guardar los stockcodes (columnas de la matriz) para que la API no cargue el .pkl
+    stockcodes_path = 'models/stockcodes.npy'
+    np.save(stockcodes_path, np.asarray(sc_u, dtype=str))
+    mlflow.log_artifact(stockcodes_path)
+
+    # Calcular similitudes entre productos en float32: normalizar las columnas una vez
+    # sobre la matriz dispersa y materializar solo el resultado (productos x productos)
+    X = basket.astype(np.float32)
+    norms = np.sqrt(np.asarray(X.multiply(X).sum(axis=0)).ravel())
+    Xn = (X @ sp.diags(1 / np.maximum(norms, 1e-12))).astype(np.float32).tocsr()
+    product_similarities = (Xn.T @ Xn).toarray()
+    del X, Xn
+
+    # Guardar la matriz de similitudes en un archivo .npy para cargarla con mmap
+    product_similarities_path = 'models/product_similarities.npy'
+    np.save(product_similarities_path, product_similarities)
     
     # Registrar el archivo de similitudes en MLflow
     mlflow.log_artifact(product_similarities_path)
 
+    # Precalcular la tabla de los N_MAX productos más similares, ordenados por similitud
+    # y sin incluir al propio producto (misma definición que precompute_topn.py)
+    scores = product_similarities.copy()
+    np.fill_diagonal(scores, -np.inf)
+    n_max = min(N_MAX, scores.shape[1] - 1)
+    top_idx = np.argpartition(-scores, n_max - 1, axis=1)[:, :n_max]
+    order = np.argsort(-np.take_along_axis(scores, top_idx, 1), axis=1, kind='stable')
+    top_idx = np.take_along_axis(top_idx, order, 1).astype(np.int32)
+    del scores
+
+    # Guardar la tabla en un archivo .npy y registrarla en MLflow
+    top_similar_products_path = 'models/top_similar_products.npy'
+    np.save(top_similar_products_path, top_idx)
+    mlflow.log_artifact(top_similar_products_path)
+
     # Función para recomendar productos similares
-    def recommended_products(stockcode, product_similarities, n=10):
+    def recommended_products(stockcode, top_idx, n=10):
         product_idx = co_ocurrence_matrix.columns.get_loc(stockcode)
-        sim_scores = list(enumerate(product_similarities[product_idx]))
-        sim_scores = sorted(sim_scores, key=lambda x: x[1], reverse=True)
-        sim_scores = sim_scores[1:n+1]
-        similar_products = [co_ocurrence_matrix.columns[i[0]] for i in sim_scores]
-        return similar_products
+        cols = co_ocurrence_matrix.columns.to_numpy()
+        return cols[top_idx[product_idx, :n]].tolist()
 
     # Ejemplo de uso
     stockcode = "21937"
-    recommendations = recommended_products(stockcode=stockcode, product_similarities=product_similarities)
+    recommendations = recommended_products(stockcode=stockcode, top_idx=top_idx)
     
     # Registrar resultados en MLflow
     mlflow.log_param("stockcode", stockcode)
@@ -3,12 +3,14 @@ import pandas as pd
 from sklearn.metrics.pairwise import cosine_similarity
 import snowflake.connector
 import os
+import shutil
+import tempfile
 from dotenv import load_dotenv
-from mlxtend.frequent_patterns import fpgrowth, association_rules
+from mlxtend.frequent_patterns import association_rules
+from fim import fpgrowth
 import mlflow
 import mlflow.sklearn
 import sqlite3
-import pickle
 
 # Cargar variables de entorno
 load_dotenv()
@@ -22,6 +24,9 @@ mlflow.start_run()
 try:
     # Conectar a la base de datos SQLite
     conn = sqlite3.connect('recommendations.db')
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('PRAGMA synchronous=NORMAL')
+    conn.execute('PRAGMA temp_store=MEMORY')
     cursor = conn.cursor()
 
     # Crear tabla si no existe
@@ -37,35 +42,45 @@ try:
 
     # Transformar el DataFrame en formato de cesta de compras
     basket = dataframe_retail_data.groupby(["INVOICENO", "STOCKCODE"])["QUANTITY"].sum().unstack().fillna(0)
-    basket = basket.applymap(lambda x: 1 if x > 0 else 0)
+    basket = basket.gt(0)
 
-    # Usar FP-Growth en lugar de Apriori
-    frequent_itemsets = fpgrowth(basket, min_support=0.01, use_colnames=True)
+    # Usar FP-Growth (pyfim, implementado en C) en lugar de Apriori
+    transactions = [basket.columns[row].tolist() for row in basket.to_numpy()]
+    itemsets = fpgrowth(transactions, supp=1.0, zmin=1, report='s')
+    frequent_itemsets = pd.DataFrame({
+        'support': [support for _, support in itemsets],
+        'itemsets': [frozenset(itemset) for itemset, _ in itemsets]
+    })
 
-    # Guardar los conjuntos frecuentes en un archivo .pkl
-    os.makedirs('models', exist_ok=True)
-    frequent_itemsets_path = '../models/frequent_itemsets.pkl'
-    with open(frequent_itemsets_path, 'wb') as f:
-        pickle.dump(frequent_itemsets, f)
+    # Generar las reglas de asociación, ordenadas por lift descendente
+    rules = association_rules(frequent_itemsets, metric="lift", min_threshold=1)
+    rules = rules.sort_values('lift', ascending=False).reset_index(drop=True)
 
-    # Registrar el archivo de conjuntos frecuentes en MLflow
-    mlflow.log_artifact(frequent_itemsets_path)
+    # Guardar los artefactos de esta ejecución en un directorio propio (los frozenset se guardan como listas)
+    with tempfile.TemporaryDirectory() as run_dir:
+        frequent_itemsets_path = os.path.join(run_dir, 'frequent_itemsets.parquet')
+        frequent_itemsets.assign(
+            itemsets=frequent_itemsets['itemsets'].map(sorted)
+        ).to_parquet(frequent_itemsets_path, engine='pyarrow', index=False)
 
-    # Generar las reglas de asociación
-    rules = association_rules(frequent_itemsets, metric="lift", min_threshold=1)
+        rules_path = os.path.join(run_dir, 'association_rules.parquet')
+        rules.assign(
+            antecedents=rules['antecedents'].map(sorted),
+            consequents=rules['consequents'].map(sorted)
+        ).to_parquet(rules_path, engine='pyarrow', index=False)
 
-    # Guardar las reglas de asociación en un archivo .pkl 
-    rules_path = '../models/association_rules.pkl'
-    with open(rules_path, 'wb') as f:
-        pickle.dump(rules, f)
+        # Registrar los artefactos del modelo en MLflow en una sola subida
+        mlflow.log_artifacts(run_dir)
 
-    # Registrar el archivo de reglas de asociación en MLflow
-    mlflow.log_artifact(rules_path)
+        # Copiar las reglas al directorio de modelos que lee la API
+        models_dir = '../models'
+        os.makedirs(models_dir, exist_ok=True)
+        shutil.copy(rules_path, os.path.join(models_dir, 'association_rules.parquet'))
 
     # Función para recomendar productos basados en reglas de asociación
     def recommend_association_rules(stockcode, rules, n=10):
-        product_rules = rules[rules['antecedents'].apply(lambda x: stockcode in x)]
-        product_rules = product_rules.sort_values(by='lift', ascending=False).head(n)
+        # Las reglas ya están ordenadas por lift descendente
+        product_rules = rules[rules['antecedents'].apply(lambda x: stockcode in x)].head(n)
         recommended_products = []
         for rule in product_rules['consequents']:
             recommended_products.extend(list(rule))
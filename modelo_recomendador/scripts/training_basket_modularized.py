@@ -3,7 +3,11 @@ from dotenv import load_dotenv
 import sqlite3
 import mlflow
 import pandas as pd
-from mlxtend.frequent_patterns import fpgrowth, association_rules
+import polars as pl
+import pyarrow.parquet as pq
+import scipy.sparse as sp
+from mlxtend.frequent_patterns import association_rules
+from fim import fpgrowth as fim_fpgrowth
 import pickle
 import snowflake.connector
 
@@ -38,14 +42,14 @@ def connect_to_snowflake():
 
 def fetch_data_from_snowflake(conn, query=""):
     """
-    Ejecuta una consulta en Snowflake y devuelve los datos como un DataFrame.
+    Ejecuta una consulta en Snowflake y devuelve los datos como una tabla de Arrow.
 
     Args:
         conn (snowflake.connector.SnowflakeConnection): Conexión a Snowflake.
         query (str): Consulta SQL a ejecutar.
 
     Returns:
-        pandas.DataFrame: DataFrame con los datos obtenidos de Snowflake.
+        pyarrow.Table: Tabla con los datos obtenidos de Snowflake (vacía si la consulta no devuelve filas).
     
     Raises:
         snowflake.connector.errors.ProgrammingError: Si hay un error en la consulta SQL.
@@ -57,9 +61,9 @@ def fetch_data_from_snowflake(conn, query=""):
     try:
         cursor = conn.cursor()
         cursor.execute(query)
-        dataframe = cursor.fetch_pandas_all()
+        table = cursor.fetch_arrow_all(force_return_table=True)
         cursor.close()
-        return dataframe
+        return table
     except snowflake.connector.errors.ProgrammingError as e:
         print(f"Error de SQL en Snowflake: {e}")
         raise
@@ -81,13 +85,20 @@ def connect_to_db(db_name='recommendations.db'):
     """
     Conecta a la base de datos SQLite y devuelve la conexión.
 
+    Configura la conexión para escrituras en lote (WAL, synchronous=NORMAL y
+    tablas temporales en memoria).
+
     Args:
         db_name (str): Nombre del archivo de la base de datos SQLite. Por defecto es 'recommendations.db'.
 
     Returns:
         sqlite3.Connection: Conexión a la base de datos SQLite.
     """
-    return sqlite3.connect(db_name)
+    conn = sqlite3.connect(db_name)
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('PRAGMA synchronous=NORMAL')
+    conn.execute('PRAGMA temp_store=MEMORY')
+    return conn
 
 def create_recommendations_table(cursor):
     """
@@ -103,19 +114,20 @@ def create_recommendations_table(cursor):
         )
     ''')
 
-def save_recommendations_to_db(cursor, stockcode, recommendations):
+def save_recommendations_to_db(cursor, pairs):
     """
-    Guarda las recomendaciones en la base de datos SQLite.
+    Guarda las recomendaciones en la base de datos SQLite con una única inserción en lote.
 
     Args:
         cursor (sqlite3.Cursor): Cursor de la conexión a la base de datos.
-        stockcode (str): Código del producto para el cual se generan las recomendaciones.
-        recommendations (list of str): Lista de códigos de productos recomendados.
+        pairs (list of tuple): Pares (stockcode, recomendaciones), donde recomendaciones
+            es la lista de códigos de productos recomendados.
     """
-    cursor.execute('''
+    rows = [(stockcode, ','.join(recommendations)) for stockcode, recommendations in pairs]
+    cursor.executemany('''
         INSERT INTO recommendations (stockcode, recommended_stockcodes)
         VALUES (?, ?)
-    ''', (stockcode, ','.join(recommendations)))
+    ''', rows)
 
 def close_db_connection(conn):
     """
@@ -184,9 +196,9 @@ def load_data(file_path='../data/old_invoice_data.parquet'):
         file_path (str): Ruta al archivo Parquet. Por defecto es '../data/old_invoice_data.parquet'.
 
     Returns:
-        pandas.DataFrame: DataFrame con los datos cargados desde el archivo Parquet.
+        pandas.DataFrame: DataFrame con columnas respaldadas por Arrow con los datos del archivo Parquet.
     """
-    return pd.read_parquet(file_path, engine='pyarrow')
+    return pd.read_parquet(file_path, engine='pyarrow', use_threads=True, dtype_backend='pyarrow')
 
 def transform_to_basket(dataframe):
     """
@@ -196,24 +208,44 @@ def transform_to_basket(dataframe):
         dataframe (pandas.DataFrame): DataFrame con los datos de transacciones.
 
     Returns:
-        pandas.DataFrame: DataFrame transformado en formato de cesta, con las cantidades sumadas.
-    """
-    basket = dataframe.groupby(["INVOICENO", "STOCKCODE"])["QUANTITY"].sum().unstack().fillna(0)
+        tuple: Matriz scipy.sparse.csr_matrix (facturas x productos), True si la cantidad sumada
+        es distinta de cero, y arreglo numpy.ndarray con los stockcodes de cada columna.
+    """
+    inv_codes, inv_u = pd.factorize(dataframe["INVOICENO"], sort=True)
+    sc_codes, sc_u = pd.factorize(dataframe["STOCKCODE"], sort=True)
+    quantities = dataframe["QUANTITY"].fillna(0).to_numpy()
+    # Descartar filas con factura o producto nulo (código -1), igual que groupby
+    keep = (inv_codes >= 0) & (sc_codes >= 0)
+    inv_codes, sc_codes, quantities = inv_codes[keep], sc_codes[keep], quantities[keep]
+    # Las entradas duplicadas (factura, producto) se suman al construir la matriz
+    basket = sp.csr_matrix((quantities, (inv_codes, sc_codes)), shape=(len(inv_u), len(sc_u)))
+    basket.eliminate_zeros()
     basket = basket.astype(bool)
-    return basket
+    return basket, sc_u.to_numpy()
 
-def generate_frequent_itemsets(basket, min_support=0.01):
+def generate_frequent_itemsets(basket, items, min_support=0.01):
     """
-    Genera conjuntos frecuentes utilizando el algoritmo FP-Growth.
+    Genera conjuntos frecuentes utilizando el algoritmo FP-Growth de pyfim (implementado en C).
 
     Args:
-        basket (pandas.DataFrame): DataFrame en formato de cesta.
+        basket (scipy.sparse.csr_matrix): Matriz dispersa en formato de cesta (facturas x productos).
+        items (numpy.ndarray): Stockcodes de cada columna de la matriz.
         min_support (float): Soporte mínimo para los conjuntos frecuentes. Por defecto es 0.01.
 
     Returns:
-        pandas.DataFrame: DataFrame con los conjuntos frecuentes generados.
-    """
-    return fpgrowth(basket, min_support=min_support, use_colnames=True)
+        pandas.DataFrame: DataFrame con las columnas 'support' e 'itemsets', con el mismo
+        esquema que `mlxtend.frequent_patterns.fpgrowth`.
+    """
+    transactions = [
+        items[basket.indices[start:end]].tolist()
+        for start, end in zip(basket.indptr[:-1], basket.indptr[1:])
+    ]
+    # pyfim recibe el soporte en porcentaje y con report='s' lo devuelve como fracción
+    itemsets = fim_fpgrowth(transactions, supp=min_support * 100, zmin=1, report='s')
+    return pd.DataFrame({
+        'support': [support for _, support in itemsets],
+        'itemsets': [frozenset(itemset) for itemset, _ in itemsets]
+    })
 
 def save_pickle(obj, file_path):
     """
@@ -227,6 +259,23 @@ def save_pickle(obj, file_path):
     with open(file_path, 'wb') as f:
         pickle.dump(obj, f)
 
+def save_rules_parquet(rules, file_path):
+    """
+    Guarda las reglas de asociación en un archivo Parquet.
+
+    Los conjuntos de antecedentes y consecuentes (frozenset) se guardan como listas
+    ordenadas, ya que Parquet no admite conjuntos.
+
+    Args:
+        rules (pandas.DataFrame): DataFrame con las reglas de asociación.
+        file_path (str): Ruta al archivo donde se guardarán las reglas.
+    """
+    os.makedirs(os.path.dirname(file_path), exist_ok=True)
+    rules.assign(
+        antecedents=rules['antecedents'].map(sorted),
+        consequents=rules['consequents'].map(sorted)
+    ).to_parquet(file_path, engine='pyarrow', index=False)
+
 def generate_association_rules(frequent_itemsets, metric="lift", min_threshold=1):
     """
     Genera reglas de asociación a partir de los conjuntos frecuentes.
@@ -237,9 +286,32 @@ def generate_association_rules(frequent_itemsets, metric="lift", min_threshold=1
         min_threshold (float): Umbral mínimo para la métrica. Por defecto es 1.
 
     Returns:
-        pandas.DataFrame: DataFrame con las reglas de asociación generadas.
+        pandas.DataFrame: DataFrame con las reglas de asociación generadas, ordenadas por lift descendente.
     """
-    return association_rules(frequent_itemsets, metric=metric, min_threshold=min_threshold)
+    rules = association_rules(frequent_itemsets, metric=metric, min_threshold=min_threshold)
+    return rules.sort_values('lift', ascending=False).reset_index(drop=True)
+
+def rules_to_polars(rules):
+    """
+    Convierte las reglas de asociación a un DataFrame de Polars.
+
+    Los antecedentes y consecuentes se guardan como columnas List(Utf8), lo que
+    permite filtrar las reglas con un kernel vectorizado en lugar de un `.apply`.
+
+    Args:
+        rules (pandas.DataFrame): DataFrame con las reglas de asociación.
+
+    Returns:
+        polars.DataFrame: DataFrame de Polars con las reglas de asociación.
+    """
+    rules = rules.assign(
+        antecedents=rules['antecedents'].map(sorted),
+        consequents=rules['consequents'].map(sorted)
+    )
+    return pl.from_pandas(rules).with_columns(
+        pl.col('antecedents').cast(pl.List(pl.Utf8)),
+        pl.col('consequents').cast(pl.List(pl.Utf8))
+    )
 
 def recommend_association_rules(stockcode, rules, n=10):
     """
@@ -247,17 +319,16 @@ def recommend_association_rules(stockcode, rules, n=10):
 
     Args:
         stockcode (str): Código del producto para el cual se generan las recomendaciones.
-        rules (pandas.DataFrame): DataFrame con las reglas de asociación.
+        rules (polars.DataFrame): DataFrame de Polars con las reglas de asociación, ordenadas por lift descendente.
         n (int): Número máximo de recomendaciones a devolver. Por defecto es 10.
 
     Returns:
         list of str: Lista de códigos de productos recomendados.
     """
-    product_rules = rules[rules['antecedents'].apply(lambda x: stockcode in x)]
-    product_rules = product_rules.sort_values(by='lift', ascending=False).head(n)
+    product_rules = rules.filter(pl.col('antecedents').list.contains(stockcode)).head(n)
     recommended_products = []
-    for rule in product_rules['consequents']:
-        recommended_products.extend(list(rule))
+    for rule in product_rules['consequents'].to_list():
+        recommended_products.extend(rule)
     return recommended_products
 
 def main():
@@ -302,7 +373,7 @@ def main():
         """
         # Conectar a la base de datos de Snowflake
         snowflake_conn = connect_to_snowflake()
-        dataframe_retail_data = fetch_data_from_snowflake(snowflake_conn, query)
+        table_retail_data = fetch_data_from_snowflake(snowflake_conn, query)
         snowflake_conn.close()
 
 
@@ -314,9 +385,11 @@ def main():
         new_file_path = os.path.join(data_folder, 'new_invoice_data.parquet')
 
         if check_file_exists(old_file_path):
-            dataframe_retail_data.to_parquet(path=new_file_path, engine='pyarrow', index=False)
+            pq.write_table(table_retail_data, new_file_path)
         else:
-            dataframe_retail_data.to_parquet(path=old_file_path, engine='pyarrow', index=False)
+            pq.write_table(table_retail_data, old_file_path)
+
+        dataframe_retail_data = table_retail_data.to_pandas(types_mapper=pd.ArrowDtype)
 
         # Conectar a la base de datos SQLite
         conn = connect_to_db()
@@ -326,27 +399,27 @@ def main():
         create_recommendations_table(cursor)
 
         # Transformar datos
-        basket = transform_to_basket(dataframe_retail_data)
+        basket, items = transform_to_basket(dataframe_retail_data)
 
         # Generar conjuntos frecuentes y reglas de asociación
-        frequent_itemsets = generate_frequent_itemsets(basket)
+        frequent_itemsets = generate_frequent_itemsets(basket, items)
         save_pickle(frequent_itemsets, '../models/frequent_itemsets.pkl')
         log_artifact_to_mlflow('../models/frequent_itemsets.pkl')
 
         rules = generate_association_rules(frequent_itemsets)
-        save_pickle(rules, '../models/association_rules.pkl')
-        log_artifact_to_mlflow('../models/association_rules.pkl')
+        save_rules_parquet(rules, '../models/association_rules.parquet')
+        log_artifact_to_mlflow('../models/association_rules.parquet')
 
         # Generar recomendaciones
         stockcode = "23355"
-        recommendations = recommend_association_rules(stockcode=stockcode, rules=rules)
+        recommendations = recommend_association_rules(stockcode=stockcode, rules=rules_to_polars(rules))
 
         # Registrar en MLflow
         log_param_to_mlflow("stockcode", stockcode)
         log_metric_to_mlflow("num_recommendations", len(recommendations))
 
         # Guardar resultados en la base de datos
-        save_recommendations_to_db(cursor, stockcode, recommendations)
+        save_recommendations_to_db(cursor, [(stockcode, recommendations)])
         conn.commit()
 
         print(recommendations)